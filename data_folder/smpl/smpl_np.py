@@ -1,30 +1,167 @@
+import os
 import sys
+import shutil
+import concurrent.futures
 import numpy as np
 import pickle
+import scipy.sparse
+
+# arrays of the model, as named in the original pkl
+MODEL_ARRAYS = [
+  'J_regressor', 'weights', 'posedirs', 'v_template', 'shapedirs', 'f',
+  'kintree_table'
+]
+
+def load_params(model_path):
+  """
+  Load the SMPL model parameters.
+
+  Parameter:
+  ---------
+  model_path: Path to the pkl model, to a npz model (e.g. SMPL-H for AMASS),
+  or to a store written by `convert_model`. The arrays of a store are
+  memory-mapped read-only, so processes loading the same store share a
+  single copy in the page cache.
+
+  Return:
+  ------
+  Dictionary with the arrays in `MODEL_ARRAYS`.
+
+  """
+  if os.path.isdir(model_path):
+    return {
+      name: np.load(os.path.join(model_path, name + '.npy'), mmap_mode='r')
+      for name in MODEL_ARRAYS
+    }
+  if model_path.endswith('.npz'):
+    with np.load(model_path) as params:
+      return {name: params[name] for name in MODEL_ARRAYS}
+  with open(model_path, 'rb') as f:
+    if sys.version_info[0] == 2:
+      params = pickle.load(f) # Python 2.x
+    elif sys.version_info[0] == 3:
+      params = pickle.load(f, encoding='latin1') # Python 3.x
+  return {name: params[name] for name in MODEL_ARRAYS}
+
+def convert_model(model_path, store_path=None, dtype=np.float64):
+  """
+  One-time conversion of a pkl model to a folder of flat `.npy` arrays.
+  The store keeps the size and modification time of the pkl it was converted
+  from (`key.npy`). Nothing is done if they match, the store is rebuilt
+  otherwise (e.g. when the pkl is replaced).
+
+  Parameters:
+  ---------
+  model_path: Path to the pkl model.
+
+  store_path: Output folder. Defaults to the model path without extension
+  with a `_npy` suffix.
+
+  dtype: Precision of the stored float arrays. Use the same as `SMPLModel`
+  to map them without any copy.
+
+  Return:
+  ------
+  Path to the store, to be given to `SMPLModel`.
+
+  """
+  if store_path is None:
+    store_path = os.path.splitext(model_path)[0] + '_npy'
+  st = os.stat(model_path)
+  key = np.array([st.st_size, st.st_mtime_ns], np.int64)
+  if np.array_equal(_store_key(store_path), key):
+    return store_path
+  params = load_params(model_path)
+  # write to a temporary folder first, parallel workers may convert concurrently
+  tmp_path = store_path + '.tmp{}'.format(os.getpid())
+  os.makedirs(tmp_path)
+  for name in MODEL_ARRAYS:
+    x = params[name]
+    if scipy.sparse.issparse(x):
+      x = x.toarray()
+    x = np.asarray(x)
+    if name not in ['f', 'kintree_table']:
+      x = x.astype(dtype)
+    np.save(os.path.join(tmp_path, name + '.npy'), x)
+  np.save(os.path.join(tmp_path, 'key.npy'), key)
+  # move an outdated store out of the way, unless another worker already did
+  old_path = store_path + '.old{}'.format(os.getpid())
+  if os.path.isdir(store_path) and not np.array_equal(_store_key(store_path), key):
+    try:
+      os.rename(store_path, old_path)
+    except OSError:
+      pass
+  try:
+    os.rename(tmp_path, store_path)
+  except OSError:
+    if not os.path.isdir(store_path):
+      raise
+    shutil.rmtree(tmp_path)
+  # arrays still mapped by a running process may not be deletable (Windows)
+  shutil.rmtree(old_path, ignore_errors=True)
+  return store_path
+
+def _store_key(store_path):
+  # size and modification time of the pkl a store was converted from, None if
+  # there is no store or it predates the key
+  key_path = os.path.join(store_path, 'key.npy')
+  return np.load(key_path) if os.path.isfile(key_path) else None
 
 class SMPLModel():
-  def __init__(self, model_path):
+  def __init__(self, model_path, dtype=np.float64, num_betas=None, skinning_k=None):
     """
     SMPL model.
 
-    Parameter:
+    Parameters:
     ---------
     model_path: Path to the SMPL model parameters, pre-processed by
-    `preprocess.py`.
-
-    """
-    with open(model_path, 'rb') as f:
-      if sys.version_info[0] == 2: 
-        params = pickle.load(f) # Python 2.x
-      elif sys.version_info[0] == 3: 
-        params = pickle.load(f, encoding='latin1') # Python 3.x
-      self.J_regressor = params['J_regressor']
-      self.weights = params['weights']
-      self.posedirs = params['posedirs']
-      self.v_template = params['v_template']
-      self.shapedirs = params['shapedirs']
-      self.faces = params['f']
-      self.kintree_table = params['kintree_table']
+    `preprocess.py`, or to a memory-mapped store written by `convert_model`.
+
+    dtype: Precision used for all the computations. With `np.float32` the
+    joint regressor is also stored as a sparse CSR matrix, which is enough
+    for the float32 PC2 caches (see `precision_report`).
+
+    num_betas: Number of shape components to use, defaults to all the ones
+    of the model.
+
+    skinning_k: If given, each vertex is skinned only by its `skinning_k`
+    most influent joints (renormalized weights). This is an accuracy
+    experiment, not an optimization: the truncated weights are still applied
+    with the dense matmul, a sparse product was measured slower than it. The
+    error of a vertex is at most its dropped weight mass times the largest
+    distance between the positions two joints' transforms give to it. The
+    largest dropped mass is `weights_dropped`, see also `precision_report`.
+
+    """
+    self.model_path = model_path
+    params = load_params(model_path)
+    self.J_regressor = params['J_regressor']
+    self.weights = params['weights']
+    self.posedirs = params['posedirs']
+    self.v_template = params['v_template']
+    self.shapedirs = params['shapedirs'][:, :, :num_betas]
+    self.faces = params['f']
+    self.kintree_table = params['kintree_table']
+    # the original pkl stores chumpy arrays, keep plain ndarrays (J_regressor
+    # may also be a scipy sparse matrix, which supports `dot` as well)
+    self.dtype = np.dtype(dtype)
+    for name in ['weights', 'posedirs', 'v_template', 'shapedirs']:
+      setattr(self, name, np.asarray(getattr(self, name), dtype=self.dtype))
+    if self.dtype != np.float64:
+      self.J_regressor = scipy.sparse.csr_matrix(self.J_regressor, dtype=self.dtype)
+    self.skinning_k = skinning_k
+    self.weights_dropped = 0.0
+    if skinning_k is not None:
+      joints = np.argsort(-self.weights, axis=1)[:, :skinning_k]
+      weights = np.take_along_axis(self.weights, joints, axis=1)
+      self.weights_dropped = float(np.max(1 - weights.sum(axis=1) / self.weights.sum(axis=1)))
+      weights = weights / weights.sum(axis=1, keepdims=True)
+      self.weights = np.zeros_like(self.weights)
+      np.put_along_axis(self.weights, joints, weights, axis=1)
+    # [6890*3, 207] contiguous layout, the pose blend is a single GEMV/GEMM
+    self.posedirs_flat = np.ascontiguousarray(
+      self.posedirs.reshape((-1, self.posedirs.shape[-1]))
+    )
 
     id_to_col = {
       self.kintree_table[1, i]: i for i in range(self.kintree_table.shape[1])
@@ -33,9 +170,22 @@ class SMPLModel():
       i: id_to_col[self.kintree_table[0, i]]
       for i in range(1, self.kintree_table.shape[1])
     }
+    self.parent_ids = np.array(
+      [self.parent[i] for i in range(1, self.kintree_table.shape[1])]
+    )
+    # joints grouped by depth in the kinematic tree, each group only depends
+    # on the previous one and is composed with a single batched matmul
+    depth = [0]
+    for i in range(1, self.kintree_table.shape[1]):
+      depth.append(depth[self.parent[i]] + 1)
+    depth = np.array(depth)
+    self.levels = [
+      (np.flatnonzero(depth == d), self.parent_ids[np.flatnonzero(depth == d) - 1])
+      for d in range(1, depth.max() + 1)
+    ]
 
-    self.pose_shape = [24, 3]
-    self.beta_shape = [10]
+    self.pose_shape = [self.kintree_table.shape[1], 3]
+    self.beta_shape = [self.shapedirs.shape[-1]]
     self.trans_shape = [3]
 
     self.pose = np.zeros(self.pose_shape)
@@ -46,6 +196,15 @@ class SMPLModel():
     self.J = None
     self.R = None
 
+    # shape dependent terms keyed on beta, betas are fixed for a whole sequence
+    self.shape_cache = {}
+    self.shape_cache_size = 8
+    # parameters changed since the last update
+    self.dirty = {'pose', 'beta', 'trans'}
+    self.v_shaped = None
+    self.v_offsets = None
+    self.v_skinned = None
+
     self.update()
 
   def set_params(self, pose=None, beta=None, trans=None):
@@ -69,56 +228,216 @@ class SMPLModel():
     Updated vertices.
 
     """
-    if pose is not None:
-      self.pose = pose
-    if beta is not None:
-      self.beta = beta
-    if trans is not None:
-      self.trans = trans
+    for name, value in (('pose', pose), ('beta', beta), ('trans', trans)):
+      if value is not None and not np.array_equal(value, getattr(self, name)):
+        setattr(self, name, np.array(value, dtype=np.float64))
+        self.dirty.add(name)
     self.update()
     return self.verts, self.J
 
+  def forward(self, poses, trans, beta=None):
+    """
+    Evaluate a whole sequence in a single vectorized pass. All the frames share
+    the same shape. The internal state of the model is not modified.
+
+    Parameters:
+    ---------
+    poses: Axis-angle rotations of shape [T, 24, 3] (or [T, 72]).
+
+    trans: Global translations of shape [T, 3].
+
+    beta: Shape parameters of shape [10]. Defaults to the current `beta`.
+
+    Return:
+    ------
+    Vertices of shape [T, 6890, 3] and joints of shape [T, 24, 3], the same
+    values `set_params` returns frame by frame.
+
+    """
+    if beta is None:
+      beta = self.beta
+    poses = np.asarray(poses, dtype=self.dtype).reshape([-1] + self.pose_shape)
+    trans = np.asarray(trans, dtype=self.dtype).reshape([-1] + self.trans_shape)
+    v_shaped, J = self.shape_terms(beta)
+    R = self.rodrigues(poses.reshape((-1, 1, 3))).reshape(poses.shape + (3,))
+    v_posed = v_shaped + self.pose_blend(R)
+    G = self.world_transforms(R, J)
+    verts = self.skinning(G, v_posed) + trans[:, None, :]
+    return verts, np.broadcast_to(J, (poses.shape[0],) + J.shape)
+
+  def forward_joints(self, poses, trans, beta=None):
+    """
+    Posed joints of a whole sequence, without any skinning.
+
+    Parameters:
+    ---------
+    poses, trans, beta: Sequence to evaluate, as in `forward`.
+
+    Return:
+    ------
+    World transformations of the joints of shape [T, 24, 4, 4]. The posed
+    joint locations are in `[..., :3, 3]`.
+
+    """
+    if beta is None:
+      beta = self.beta
+    poses = np.asarray(poses, dtype=self.dtype).reshape([-1] + self.pose_shape)
+    trans = np.asarray(trans, dtype=self.dtype).reshape([-1] + self.trans_shape)
+    J = self.shape_terms(beta)[1]
+    R = self.rodrigues(poses.reshape((-1, 1, 3))).reshape(poses.shape + (3,))
+    G = self.world_transforms(R, J, relative=False)
+    G[:, :, :3, 3] += trans[:, None, :]
+    return G
+
+  def forward_vertices(self, indices, poses, trans, beta=None):
+    """
+    Skin only a subset of the vertices (e.g. markers) of a whole sequence.
+
+    Parameters:
+    ---------
+    indices: Indices of the vertices to evaluate, of shape [K].
+
+    poses, trans, beta: Sequence to evaluate, as in `forward`.
+
+    Return:
+    ------
+    Vertices of shape [T, K, 3], equal to `forward(...)[0][:, indices]`.
+
+    """
+    if beta is None:
+      beta = self.beta
+    poses = np.asarray(poses, dtype=self.dtype).reshape([-1] + self.pose_shape)
+    trans = np.asarray(trans, dtype=self.dtype).reshape([-1] + self.trans_shape)
+    v_shaped, J = self.shape_terms(beta)
+    R = self.rodrigues(poses.reshape((-1, 1, 3))).reshape(poses.shape + (3,))
+    v_posed = v_shaped[indices] + self.pose_blend(R, indices)
+    G = self.world_transforms(R, J)
+    return self.skinning(G, v_posed, indices) + trans[:, None, :]
+
+  def shape_terms(self, beta):
+    """
+    Shape dependent terms of the model.
+
+    Parameter:
+    ---------
+    beta: Shape parameters of shape [10].
+
+    Return:
+    ------
+    Shaped template of shape [6890, 3] and rest joints of shape [24, 3].
+    Both are cached and read-only.
+
+    """
+    beta = np.asarray(beta, dtype=self.dtype)
+    key = beta.tobytes()
+    if key not in self.shape_cache:
+      v_shaped = self.shapedirs.dot(beta) + self.v_template
+      J = self.J_regressor.dot(v_shaped)
+      v_shaped.flags.writeable = False
+      J.flags.writeable = False
+      if len(self.shape_cache) >= self.shape_cache_size:
+        # drop the oldest entry
+        del self.shape_cache[next(iter(self.shape_cache))]
+      self.shape_cache[key] = (v_shaped, J)
+    return self.shape_cache[key]
+
+  def pose_blend(self, R, indices=None):
+    """
+    Pose blend shapes in a batched manner.
+
+    Parameters:
+    ---------
+    R: Joint rotation matrices of shape [batch_size, 24, 3, 3].
+
+    indices: Optional subset of the vertices to evaluate.
+
+    Return:
+    ------
+    Vertex offsets of shape [batch_size, 6890, 3] (or [batch_size, K, 3]).
+
+    """
+    lrotmin = (R[:, 1:] - np.eye(3, dtype=R.dtype)).reshape((R.shape[0], -1))
+    posedirs = self.posedirs_flat
+    if indices is not None:
+      posedirs = self.posedirs[indices].reshape((-1, posedirs.shape[1]))
+    return np.matmul(lrotmin, posedirs.T).reshape((R.shape[0], -1, 3))
+
+  def world_transforms(self, R, J, relative=True):
+    """
+    World transformation of each joint, relative to its rest position, in a
+    batched manner.
+
+    Parameters:
+    ---------
+    R: Joint rotation matrices of shape [batch_size, 24, 3, 3].
+
+    J: Rest joint locations of shape [24, 3], or [batch_size, 24, 3] when
+    they change along the batch.
+
+    relative: If False the absolute transformations are returned instead,
+    their translations are the posed joint locations.
+
+    Return:
+    ------
+    Transformations of shape [batch_size, 24, 4, 4].
+
+    """
+    G = np.zeros((R.shape[0], self.kintree_table.shape[1], 4, 4), R.dtype)
+    G[:, :, :3, :3] = R
+    G[:, 0, :3, 3] = J[..., 0, :]
+    G[:, 1:, :3, 3] = J[..., 1:, :] - J[..., self.parent_ids, :]
+    G[:, :, 3, 3] = 1
+    for joints, parents in self.levels:
+      G[:, joints] = np.matmul(G[:, parents], G[:, joints])
+    if relative:
+      G[:, :, :3, 3] -= np.matmul(G[:, :, :3, :3], J[..., None])[..., 0]
+    return G
+
+  def skinning(self, G, v_posed, indices=None):
+    """
+    Linear blend skinning in a batched manner.
+
+    Parameters:
+    ---------
+    G: Joint transformations of shape [batch_size, 24, 4, 4].
+
+    v_posed: Posed template of shape [batch_size, 6890, 3] (or
+    [batch_size, K, 3] for a subset of the vertices).
+
+    indices: Optional subset of the vertices in `v_posed`.
+
+    Return:
+    ------
+    Skinned vertices of shape [batch_size, 6890, 3] (or [batch_size, K, 3]).
+
+    """
+    weights = self.weights if indices is None else self.weights[indices]
+    # only the upper [3, 4] block of each transformation is needed
+    T = np.matmul(weights, G[:, :, :3, :].reshape((G.shape[0], -1, 12)))
+    T = T.reshape((G.shape[0], -1, 3, 4))
+    return np.matmul(T[..., :3], v_posed[..., None])[..., 0] + T[..., 3]
+
   def update(self):
     """
-    Called automatically when parameters are updated.
+    Called automatically when parameters are updated. Only the terms depending
+    on the parameters in `dirty` are recomputed: a pose change skips the shape
+    blend and a translation change is a single add.
 
     """
-    # how beta affect body shape
-    v_shaped = self.shapedirs.dot(self.beta) + self.v_template
-    # joints location
-    self.J = self.J_regressor.dot(v_shaped)
-    pose_cube = self.pose.reshape((-1, 1, 3))
-    # rotation matrix for each joint
-    self.R = self.rodrigues(pose_cube)
-    I_cube = np.broadcast_to(
-      np.expand_dims(np.eye(3), axis=0),
-      (self.R.shape[0]-1, 3, 3)
-    )
-    lrotmin = (self.R[1:] - I_cube).ravel()
-    # how pose affect body shape in zero pose
-    v_posed = v_shaped + self.posedirs.dot(lrotmin)
-    # world transformation of each joint
-    G = np.empty((self.kintree_table.shape[1], 4, 4))
-    G[0] = self.with_zeros(np.hstack((self.R[0], self.J[0, :].reshape([3, 1]))))
-    for i in range(1, self.kintree_table.shape[1]):
-      G[i] = G[self.parent[i]].dot(
-        self.with_zeros(
-          np.hstack(
-            [self.R[i],((self.J[i, :]-self.J[self.parent[i],:]).reshape([3,1]))]
-          )
-        )
-      )
-    G = G - self.pack(
-      np.matmul(
-        G,
-        np.hstack([self.J, np.zeros([24, 1])]).reshape([24, 4, 1])
-        )
-      )
-    # transformation of each vertex
-    T = np.tensordot(self.weights, G, axes=[[1], [0]])
-    rest_shape_h = np.hstack((v_posed, np.ones([v_posed.shape[0], 1])))
-    v = np.matmul(T, rest_shape_h.reshape([-1, 4, 1])).reshape([-1, 4])[:, :3]
-    self.verts = v + self.trans.reshape([1, 3])
+    if 'beta' in self.dirty:
+      # how beta affect body shape and joints location
+      self.v_shaped, self.J = self.shape_terms(self.beta)
+    if 'pose' in self.dirty:
+      # rotation matrix for each joint
+      self.R = self.rodrigues(self.pose.reshape((-1, 1, 3)).astype(self.dtype))
+      # how pose affect body shape in zero pose
+      self.v_offsets = self.pose_blend(self.R[None])[0]
+    if 'pose' in self.dirty or 'beta' in self.dirty:
+      # world transformation of each joint and of each vertex
+      G = self.world_transforms(self.R[None], self.J)
+      self.v_skinned = self.skinning(G, (self.v_shaped + self.v_offsets)[None])[0]
+    self.verts = self.v_skinned + self.trans.reshape([1, 3]).astype(self.dtype)
+    self.dirty.clear()
 
   def rodrigues(self, r):
     """
@@ -136,17 +455,17 @@ class SMPLModel():
     """
     theta = np.linalg.norm(r, axis=(1, 2), keepdims=True)
     # avoid zero divide
-    theta = np.maximum(theta, np.finfo(np.float64).tiny)
+    theta = np.maximum(theta, np.finfo(r.dtype).tiny)
     r_hat = r / theta
     cos = np.cos(theta)
-    z_stick = np.zeros(theta.shape[0])
+    z_stick = np.zeros(theta.shape[0], r.dtype)
     m = np.dstack([
       z_stick, -r_hat[:, 0, 2], r_hat[:, 0, 1],
       r_hat[:, 0, 2], z_stick, -r_hat[:, 0, 0],
       -r_hat[:, 0, 1], r_hat[:, 0, 0], z_stick]
     ).reshape([-1, 3, 3])
     i_cube = np.broadcast_to(
-      np.expand_dims(np.eye(3), axis=0),
+      np.expand_dims(np.eye(3, dtype=r.dtype), axis=0),
       [theta.shape[0], 3, 3]
     )
     A = np.transpose(r_hat, axes=[0, 2, 1])
@@ -184,4 +503,149 @@ class SMPLModel():
     Matrix of shape [batch_size, 4, 4] after appending.
 
     """
-    return np.dstack((np.zeros((x.shape[0], 4, 3)), x))
\ No newline at end of file
+    return np.dstack((np.zeros((x.shape[0], 4, 3)), x))
+
+
+class SMPLHModel(SMPLModel):
+  def __init__(self, model_path, dmpl_path=None, num_betas=10, num_dmpls=8,
+               dtype=np.float64):
+    """
+    SMPL-H model with optional DMPL soft-tissue components, as used by AMASS.
+    It matches `human_body_prior`'s `BodyModel` without requiring torch.
+    Poses have 52 joints: root orientation, 21 body joints and 30 hand joints.
+
+    Parameters:
+    ---------
+    model_path: Path to the SMPL-H `model.npz` (or a `convert_model` store).
+
+    dmpl_path: Path to the DMPL `model.npz`, None to disable DMPLs.
+
+    num_betas: Number of shape components to use.
+
+    num_dmpls: Number of DMPL components to use.
+
+    dtype: Precision used for all the computations.
+
+    """
+    super().__init__(model_path, dtype, num_betas)
+    self.dmpl_path = dmpl_path
+    self.dmpldirs_flat = None
+    if dmpl_path is not None and num_dmpls:
+      with np.load(dmpl_path) as params:
+        dmpldirs = np.asarray(params['eigvec'][:, :, :num_dmpls], dtype=self.dtype)
+      # [6890*3, num_dmpls] vertex offsets and the joint offsets they induce
+      self.dmpldirs_flat = np.ascontiguousarray(dmpldirs.reshape((-1, num_dmpls)))
+      self.J_dmpl_flat = np.ascontiguousarray(
+        self.J_regressor.dot(dmpldirs.reshape((dmpldirs.shape[0], -1)))
+        .reshape((-1, num_dmpls))
+      )
+
+  def forward(self, poses, trans, beta=None, dmpls=None):
+    """
+    Evaluate a whole sequence in a single vectorized pass. `beta` is shared by
+    all the frames, DMPLs are given per frame.
+
+    Parameters:
+    ---------
+    poses, trans, beta: Sequence to evaluate, as in `SMPLModel.forward`.
+
+    dmpls: DMPL coefficients of shape [T, num_dmpls], ignored if the model
+    has been loaded without DMPLs.
+
+    Return:
+    ------
+    Vertices of shape [T, 6890, 3] and rest joints of shape [T, 52, 3].
+
+    """
+    if dmpls is None or self.dmpldirs_flat is None:
+      return super().forward(poses, trans, beta)
+    if beta is None:
+      beta = self.beta
+    poses = np.asarray(poses, dtype=self.dtype).reshape([-1] + self.pose_shape)
+    trans = np.asarray(trans, dtype=self.dtype).reshape([-1] + self.trans_shape)
+    dmpls = np.asarray(dmpls, dtype=self.dtype).reshape((poses.shape[0], -1))
+    v_shaped, J = self.shape_terms(beta)
+    v_shaped = v_shaped + np.matmul(dmpls, self.dmpldirs_flat.T).reshape(
+      (poses.shape[0],) + v_shaped.shape
+    )
+    J = J + np.matmul(dmpls, self.J_dmpl_flat.T).reshape((poses.shape[0],) + J.shape)
+    R = self.rodrigues(poses.reshape((-1, 1, 3))).reshape(poses.shape + (3,))
+    v_posed = v_shaped + self.pose_blend(R)
+    G = self.world_transforms(R, J)
+    verts = self.skinning(G, v_posed) + trans[:, None, :]
+    return verts, J
+
+def forward_parallel(smpl, out, poses, trans, beta, threads=1, chunk_size=64):
+  """
+  Evaluate a whole sequence in frame chunks, each one filling a disjoint
+  frame range of a memory-mapped output in place, optionally from a pool of
+  threads sharing the model (no new interpreter, so nothing re-imports the
+  Blender main script).
+
+  Parameters:
+  ---------
+  smpl: Model to evaluate.
+
+  out: Memory map of shape [T, 6890, 3] to fill, e.g. from `IO.mapPC2`.
+
+  poses, trans, beta: Sequence to evaluate, as in `SMPLModel.forward`.
+
+  threads: Number of worker threads. Defaults to 1: the matmuls already run
+  on NumPy's (usually multithreaded) BLAS, more threads only pay off when
+  BLAS is single-threaded and oversubscribe the CPU otherwise. Scaling has
+  not been benchmarked on a multi-core machine.
+
+  chunk_size: Number of frames evaluated at once.
+
+  """
+  poses = np.asarray(poses).reshape([-1] + smpl.pose_shape)
+  trans = np.asarray(trans).reshape([-1] + smpl.trans_shape)
+  starts = range(0, poses.shape[0], chunk_size)
+
+  def task(start):
+    stop = start + chunk_size
+    out[start:stop] = smpl.forward(poses[start:stop], trans[start:stop], beta)[0]
+
+  threads = min(threads, len(starts))
+  if threads <= 1:
+    for start in starts:
+      task(start)
+  else:
+    # fill the shape cache once, the threads then only read it
+    smpl.shape_terms(beta)
+    with concurrent.futures.ThreadPoolExecutor(threads) as pool:
+      # list() re-raises the errors of the workers
+      list(pool.map(task, starts))
+  out.flush()
+
+def precision_report(model_path, poses, trans, beta, dtype=np.float32, skinning_k=None):
+  """
+  Accuracy of a reduced precision (and/or top-k skinning) model against the
+  float64 one.
+
+  Parameters:
+  ---------
+  model_path: Path to the SMPL model parameters.
+
+  poses, trans, beta: Sequence to evaluate, as in `SMPLModel.forward`.
+
+  dtype: Precision to evaluate.
+
+  skinning_k: Number of joints per vertex to evaluate, None for all.
+
+  Return:
+  ------
+  Dictionary with the max and mean vertex and joint errors (model units) and
+  the largest dropped skinning weight mass.
+
+  """
+  verts, J = SMPLModel(model_path).forward(poses, trans, beta)
+  smpl = SMPLModel(model_path, dtype, skinning_k=skinning_k)
+  verts_low, J_low = smpl.forward(poses, trans, beta)
+  err_v = np.linalg.norm(verts - verts_low, axis=-1)
+  err_j = np.linalg.norm(J - J_low, axis=-1)
+  return {
+    'verts_max': float(err_v.max()), 'verts_mean': float(err_v.mean()),
+    'joints_max': float(err_j.max()), 'joints_mean': float(err_j.mean()),
+    'weights_dropped': smpl.weights_dropped,
+  }
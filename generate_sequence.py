@@ -53,9 +53,12 @@ try:
     smpl_body_list = []
     # Init SMPL models
     smpl_path = os.path.join(parent_path, "surreal", "datageneration", "smpl_data")
+    # the pkl models are converted once to memory-mapped stores shared by all the workers
     smpl_models = {
-        'f': hgen.SMPLModel(os.path.join(smpl_path, 'smpl', 'models', 'basicModel_f_lbs_10_207_0_v1.0.0.pkl')),
-        'm': hgen.SMPLModel(os.path.join(smpl_path, 'smpl', 'models', 'basicModel_m_lbs_10_207_0_v1.0.0.pkl')),
+        'f': hgen.SMPLModel(hgen.convert_model(
+            os.path.join(smpl_path, 'smpl', 'models', 'basicModel_f_lbs_10_207_0_v1.0.0.pkl'))),
+        'm': hgen.SMPLModel(hgen.convert_model(
+            os.path.join(smpl_path, 'smpl', 'models', 'basicModel_m_lbs_10_207_0_v1.0.0.pkl'))),
     }
 
     if args.frame != "all":
@@ -7,5 +7,5 @@ if sys.version_info.major < 3:
 
 sys.path.remove(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 from .util.blender_util import *
-from data_folder.smpl.smpl_np import SMPLModel
+from data_folder.smpl.smpl_np import SMPLModel, convert_model
 from .generator import *
@@ -7,7 +7,8 @@ import humangenerator as hgen
 
 
 class amass:
-    def __init__(self, parent_path, with_cache, path_out, path_samples, smpl_models, write_verts, config):
+    def __init__(self, parent_path, with_cache, path_out, path_samples, smpl_models, write_verts, config,
+                 analytic_pkl=False):
         # temporary usd export path, we cannot directly write in mounted network drives sometimes
         temp_path = os.path.join(parent_path, 'usd_exports')
         # surreal path for textures
@@ -24,12 +25,17 @@ class amass:
         self.num_dmpls = config['num_dmpls']
         self.subject_ids = config['subject_ids'].split()
         self.write_verts = (write_verts == "True")
+        # write the pkl from the SMPL parameters and the body cache instead of evaluating the scene
+        self.analytic_pkl = analytic_pkl
+
+        # "numpy" (default) evaluates SMPL-H+DMPL without torch, "torch" uses human_body_prior
+        self.body_model = config.get('body_model', 'numpy')
 
         self.temp_path = temp_path
         self.body_model_m, self.faces_m = _load_parametric_body_model(parent_path, "male", self.num_betas,
-                                                                      self.num_dmpls)
+                                                                      self.num_dmpls, self.body_model)
         self.body_model_f, self.faces_f = _load_parametric_body_model(parent_path, "female", self.num_betas,
-                                                                      self.num_dmpls)
+                                                                      self.num_dmpls, self.body_model)
 
         taxonomy_file_path = os.path.join(parent_path, "taxonomy.json")
         self.supported_datasets = _get_supported_mocap_datasets(taxonomy_file_path, path_samples)
@@ -130,6 +136,20 @@ class amass:
                 for i in my_l:
                     new_info[i] = info[i]
                 hgen.export_data(self.temp_path, self.path_out, Path(subject_id).stem, self.with_cache, frame, new_info,
-                                 info['poses'][0, :3][2], self.write_verts)
+                                 info['poses'][0, :3][2], self.write_verts,
+                                 body=self.pkl_body(sample, info) if self.analytic_pkl else None)
+
+        return True
 
-        return True
\ No newline at end of file
+    def pkl_body(self, sample, info):
+        # body parameters as keyed on the armature in animateSMPL (no hand joints)
+        gender = 'm' if info['gender'] == 'male' else 'f'
+        poses = np.zeros((info['poses'].shape[0], 72))
+        poses[:, :66] = info['poses'][:, :66]
+        return {
+            'smpl': self.smpl[gender],
+            'poses': poses,
+            'trans': info['trans'],
+            'beta': info['betas'][:10],
+            'pc2_path': os.path.join(self.path_cache, sample + '.pc2') if self.with_cache else None
+        }
\ No newline at end of file
@@ -5,7 +5,7 @@ import humangenerator as hgen
 from pathlib import Path
 
 class cloth3d:
-    def __init__(self, parent_path, with_cache, path_out, path_samples, smpl_models, write_verts):
+    def __init__(self, parent_path, with_cache, path_out, path_samples, smpl_models, write_verts, analytic_pkl=False):
         from humangenerator.generator import generator
         # temporary usd export path, we cannot directly write in mounted network drives sometimes
         temp_path = os.path.join(parent_path, 'usd_exports')
@@ -19,6 +19,8 @@ class cloth3d:
         self.smpl = smpl_models
         self.temp_path = temp_path
         self.write_verts = (write_verts == "True")
+        # write the pkl from the SMPL parameters and the body cache instead of evaluating the scene
+        self.analytic_pkl = analytic_pkl
 
     def animateSMPL(self, sample, smpl_ob, info, j):
         if self.with_cache:
@@ -110,17 +112,30 @@ class cloth3d:
             bpy.context.scene.frame_current = frame
 
     def process_sample(self, sample: str, frame: int, smpl_body_list):
-        # load info
-        info = loadInfo(os.path.join(self.path_samples, sample, 'info.mat'))
-
         self.smpl_body_list = smpl_body_list
         subfolder_name = Path(sample).stem + ('_with_cache' if self.with_cache else '')
         self.path_cache = hgen.create_outfolder_structure(self.path_out, subfolder_name, self.with_cache)
 
+        # load info (cached in the view_cache folder)
+        info = loadInfo(os.path.join(self.path_samples, sample, 'info.mat'), os.path.join(self.path_cache, 'info'))
+
         if frame is None:
             self.loadCloth3DSequence(sample, info)
         else:
             self.loadCloth3DSequence(sample, info, frame)
 
         bpy.ops.wm.save_as_mainfile(filepath=os.path.join(self.path_out, subfolder_name, subfolder_name + ".blend"))
-        return hgen.export_data(self.temp_path, self.path_out, Path(sample).stem, self.with_cache, frame, info, info['zrot'], self.write_verts)
\ No newline at end of file
+        return hgen.export_data(self.temp_path, self.path_out, Path(sample).stem, self.with_cache, frame, info, info['zrot'], self.write_verts,
+                                body=self.pkl_body(sample, info) if self.analytic_pkl else None)
+
+    def pkl_body(self, sample, info):
+        # body parameters as keyed on the armature in animateSMPL
+        gender = 'm' if info['gender'] else 'f'
+        j = self.smpl[gender].shape_terms(info['shape'])[1]
+        return {
+            'smpl': self.smpl[gender],
+            'poses': info['poses'].reshape((72, -1)).T,
+            'trans': info['trans'].reshape((3, -1)).T - j[0],
+            'beta': info['shape'],
+            'pc2_path': os.path.join(self.path_cache, sample + '.pc2') if self.with_cache else None
+        }
\ No newline at end of file
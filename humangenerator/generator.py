@@ -4,21 +4,26 @@ import bpy
 from .util.smplutils import SMPL_Body, rotate_vector
 from .cloth3d_gen import *
 from .amass_gen import *
-from .util.blender_util import export_stl_data, write_pkl_data, write_usd
+from .util.blender_util import export_stl_trace, write_pkl_data, write_pkl_data_analytic, write_usd
 
 
 # import amass_gen
 
-def get_processor(dataset, parent_path, with_cache, path_out, path_samples, smpl_models, write_verts, config={}):
+def get_processor(dataset, parent_path, with_cache, path_out, path_samples, smpl_models, write_verts, config={},
+                  analytic_pkl=False):
     if dataset == "cloth3d":
-        return cloth3d(parent_path, with_cache, path_out, path_samples, smpl_models, write_verts), path_samples
+        return cloth3d(parent_path, with_cache, path_out, path_samples, smpl_models, write_verts,
+                       analytic_pkl), path_samples
     if dataset == "amass":  # todo fixme
-        tmp_obj = amass(parent_path, with_cache, path_out, path_samples, smpl_models, write_verts, config)
+        tmp_obj = amass(parent_path, with_cache, path_out, path_samples, smpl_models, write_verts, config,
+                        analytic_pkl)
         return tmp_obj, path_samples
     raise Exception("NOT A VALID DATASET")
 
 
-def export_data(temp_path, path_out, sample, with_cache, frame, info, orient, write_verts, usd=True):
+# body: dict(smpl=..., poses=..., trans=..., beta=..., pc2_path=...), to write the pkl without evaluating the scene
+# (see write_pkl_data_analytic)
+def export_data(temp_path, path_out, sample, with_cache, frame, info, orient, write_verts, usd=True, body=None):
     try:
         if usd:
             write_usd(temp_path, path_out, sample + ('_with_cache' if with_cache else ''), with_cache,
@@ -29,9 +34,14 @@ def export_data(temp_path, path_out, sample, with_cache, frame, info, orient, wr
             elif "armature" in obj.name.lower() and obj.select_get():
                 arm_ob = obj
 
-        export_stl_data(path_out, sample + ('_with_cache' if with_cache else ''),
-                        [ob for ob in bpy.data.objects if ob.select_get()], orient)
-        write_pkl_data(path_out, sample + ('_with_cache' if with_cache else ''), arm_ob, ob, info, write_verts=write_verts)
+        export_stl_trace(path_out, sample + ('_with_cache' if with_cache else ''),
+                         [ob for ob in bpy.data.objects if ob.select_get()], orient)
+        if body is not None:
+            write_pkl_data_analytic(path_out, sample + ('_with_cache' if with_cache else ''), arm_ob, ob, info,
+                                    write_verts=write_verts, **body)
+        else:
+            write_pkl_data(path_out, sample + ('_with_cache' if with_cache else ''), arm_ob, ob, info,
+                           write_verts=write_verts)
     except:
         return False
     return True
@@ -1,5 +1,7 @@
 import os
+import zlib
 import numpy as np
+from itertools import chain
 from struct import pack, unpack
 
 """
@@ -16,33 +18,99 @@ Correspondence between mesh and UV map is implicit in F to Ft correspondences
 If no UV map data in .obj file, it shall return Vt=None and Ft=None
 """
 def readOBJ(file):
-	V, Vt, F, Ft = [], [], [], []
-	with open(file, 'r') as f:
-		T = f.readlines()
-	for t in T:
-		# 3D vertex
-		if t.startswith('v '):
-			v = [float(n) for n in t.replace('v ','').split(' ')]
-			V += [v]
-		# UV vertex
-		elif t.startswith('vt '):
-			v = [float(n) for n in t.replace('vt ','').split(' ')]
-			Vt += [v]
-		# Face
-		elif t.startswith('f '):
-			idx = [n.split('/') for n in t.replace('f ','').split(' ')]
-			f = [int(n[0]) - 1 for n in idx]
-			F += [f]
-			# UV face
-			if '/' in t:
-				f = [int(n[1]) - 1 for n in idx]
-				Ft += [f]
-	V = np.array(V, np.float32)
-	Vt = np.array(Vt, np.float32)
+	with open(file, 'rb') as f:
+		T = f.read().splitlines()
+	# Classify lines once
+	V = [t[2:] for t in T if t.startswith(b'v ')]
+	Vt = [t[3:] for t in T if t.startswith(b'vt ')]
+	F = [t[2:] for t in T if t.startswith(b'f ')]
+	# 3D and UV vertices, parsed in bulk
+	V = np.fromstring(b' '.join(V), np.float32, sep=' ').reshape(len(V), -1) if V else np.array(V, np.float32)
+	Vt = np.fromstring(b' '.join(Vt), np.float32, sep=' ').reshape(len(Vt), -1) if Vt else np.array(Vt, np.float32)
+	# Faces, as 'f a b c' or 'f a/b c/d e/f' (UV faces)
+	Ft = []
+	if F:
+		n = np.array([len(t.split()) for t in F])
+		# indices per face vertex (1 or 2)
+		c = np.array([t.count(b'/') for t in F]) // n + 1
+		idx = np.fromstring(b' '.join(F).replace(b'/', b' '), np.int64, sep=' ') - 1
+		if (n == n[0]).all() and (c == c[0]).all():
+			idx = idx.reshape(len(F), n[0], c[0])
+			if c[0] > 1: Ft = idx[:, :, 1].tolist()
+			F = idx[:, :, 0].tolist()
+		else:
+			idx = np.split(idx, np.cumsum(n * c)[:-1])
+			Ft = [f[1::k].tolist() for f, k in zip(idx, c) if k > 1]
+			F = [f[::k].tolist() for f, k in zip(idx, c)]
 	if Ft: assert len(F) == len(Ft), 'Inconsistent .obj file, mesh and UV map do not have the same number of faces' 
 	else: Vt, Ft = None, None
 	return V, F, Vt, Ft
 
+"""
+Reads OBJ files through a binary sidecar cache of the parsed data
+The cache is keyed by the absolute path, size and modification time of the .obj file
+and is (re)written whenever it is missing or stale
+Inputs:
+- file: path to .obj file
+- cache_file: path to .npz cache file, by default next to the .obj file
+Outputs:
+- V, F, Vt, Ft: as readOBJ(file)
+"""
+def readOBJCached(file, cache_file=None):
+	cache_file = cache_file or file[:-4] + '_obj.npz'
+	st = os.stat(file)
+	key = np.array([st.st_size, st.st_mtime_ns], np.int64)
+	path = os.path.abspath(file)
+	if os.path.isfile(cache_file):
+		try:
+			with np.load(cache_file) as data:
+				if str(data['path']) == path and np.array_equal(data['key'], key):
+					if not 'Vt' in data: return data['V'], _unpackFaces(data, 'F'), None, None
+					return data['V'], _unpackFaces(data, 'F'), data['Vt'], _unpackFaces(data, 'Ft')
+		except Exception:
+			pass # unreadable cache, parse again
+	V, F, Vt, Ft = readOBJ(file)
+	arrays = {'path': path, 'key': key, 'V': V}
+	arrays.update(_packFaces(F, 'F'))
+	if Vt is not None:
+		arrays['Vt'] = Vt
+		arrays.update(_packFaces(Ft, 'Ft'))
+	# The cache is moved into place only once complete
+	tmp_file = cache_file[:-4] + '_tmp.npz'
+	with open(tmp_file, 'wb') as f:
+		np.savez(f, **arrays)
+	os.replace(tmp_file, cache_file)
+	return V, F, Vt, Ft
+
+def _packFaces(F, name):
+	idx, n = flattenFaces(F)
+	return {name: idx, name + 'n': n}
+
+def _unpackFaces(data, name):
+	idx, n = data[name], data[name + 'n']
+	if not len(n): return []
+	if (n == n[0]).all(): return idx.reshape(len(n), n[0]).tolist()
+	return [f.tolist() for f in np.split(idx, np.cumsum(n)[:-1])]
+
+"""
+Flattens faces (list of lists or 2D array) to vertex indices and number of vertices per face (CSR-like)
+Faces of a single size are converted at once, ragged faces are chained without per-face arrays
+Inputs:
+- F: faces
+- dtype: integer type of the outputs
+Outputs:
+- idx: flat vertex indices
+- n: number of vertices of each face
+"""
+def flattenFaces(F, dtype=np.int64):
+	if not len(F):
+		return np.zeros(0, dtype), np.zeros(0, dtype)
+	if not _isRagged(F):
+		F = np.asarray(F, dtype)
+		return F.ravel(), np.full(len(F), F.shape[1], dtype)
+	n = np.fromiter(map(len, F), dtype, len(F))
+	return np.fromiter(chain.from_iterable(F), dtype, int(n.sum())), n
+
 """
 Writes OBJ files
 Only handles vertices, faces and UV maps
@@ -58,25 +126,37 @@ If no UV map data as input, it will write only 3D data in .obj file
 def writeOBJ(file, V, F, Vt=None, Ft=None):
 	if not Vt is None:
 		assert len(F) == len(Ft), 'Inconsistent data, mesh and UV map do not have the same number of faces'
-		
+	
 	with open(file, 'w') as file:
 		# Vertices
-		for v in V:
-			line = 'v ' + ' '.join([str(_) for _ in v]) + '\n'
-			file.write(line)
+		file.write(_formatOBJ('v', V, _floatFormat(V)))
 		# UV verts
 		if not Vt is None:
-			for v in Vt:
-				line = 'vt ' + ' '.join([str(_) for _ in v]) + '\n'
-				file.write(line)
+			file.write(_formatOBJ('vt', Vt, _floatFormat(Vt)))
 		# 3D Faces / UV faces
-		if Ft:
-			F = [[str(i+1)+'/'+str(j+1) for i,j in zip(f,ft)] for f,ft in zip(F,Ft)]
+		if not Ft is None and len(Ft):
+			F = [[j for ij in zip(f, ft) for j in ij] for f, ft in zip(F, Ft)] if _isRagged(F) else \
+				np.stack((np.asarray(F), np.asarray(Ft)), -1).reshape(len(F), -1)
+			file.write(_formatOBJ('f', F, '%d/%d', 1))
 		else:
-			F = [[str(i + 1) for i in f] for f in F]		
-		for f in F:
-			line = 'f ' + ' '.join(f) + '\n'
-			file.write(line)
+			file.write(_formatOBJ('f', F, '%d', 1))
+
+# Shortest format that preserves the values of a float array
+def _floatFormat(X):
+	return '%.9g' if np.asarray(X).dtype in (np.float16, np.float32) else '%.17g'
+
+def _isRagged(X):
+	return not isinstance(X, np.ndarray) and len(set(map(len, X))) > 1
+
+# Formats a block of OBJ lines in bulk, 'token' is repeated to cover each row
+def _formatOBJ(prefix, X, token, offset=0):
+	if not len(X): return ''
+	n = token.count('%')
+	if _isRagged(X):
+		return ''.join((prefix + (' ' + token) * (len(x) // n) + '\n') % tuple(i + offset for i in x) for x in X)
+	X = np.asarray(X) + offset
+	line = prefix + (' ' + token) * (X.shape[1] // n) + '\n'
+	return (line * X.shape[0]) % tuple(X.ravel().tolist())
 
 """
 Reads PC2 files, and proposed format PC16 files
@@ -115,6 +195,64 @@ def readPC2(file, float16=False):
 		
 	return data
 	
+"""
+Reads the header of PC2/PC16 files (a single small read)
+Inputs:
+- file: path to .pc2/.pc16 file
+Output:
+- data: dictionary with .pc2/.pc16 header data, same keys as readPC2 without 'V'
+"""
+def readPC2Header(file):
+	with open(file, 'rb') as f:
+		sign, version, nPoints, startFrame, sampleRate, nSamples = unpack('<12siiffi', f.read(32))
+	return {
+		'sign': sign,
+		'version': version,
+		'nPoints': nPoints,
+		'startFrame': (startFrame,),
+		'sampleRate': (sampleRate,),
+		'nSamples': nSamples
+	}
+
+"""
+Lazily indexed, memory-mapped animation data of PC2/PC16 files
+Indexing (e.g. V[10], V[:100], V[::5]) touches only the pages of the selected frames
+and always returns a new, writable float32 array (PC2 and PC16 alike, PC16 data is upcast
+per slice), which does not keep the file mapped
+Inputs:
+- file: path to .pc2/.pc16 file
+- float16: False for PC2 files, True for PC16
+NOTE: the file stays mapped (and open) while the object is alive
+"""
+class PC2View:
+	def __init__(self, file, float16=False):
+		self.header = readPC2Header(file)
+		self.shape = (self.header['nSamples'], self.header['nPoints'], 3)
+		dtype = np.float16 if float16 else np.float32
+		if self.header['nSamples'] * self.header['nPoints']:
+			self.data = np.memmap(file, dtype=dtype, mode='r', offset=32, shape=self.shape)
+		else:
+			self.data = np.zeros(self.shape, dtype)
+
+	def __len__(self):
+		return self.shape[0]
+
+	def __getitem__(self, key):
+		return np.array(self.data[key], dtype=np.float32)
+
+"""
+Reads PC2 files, and proposed format PC16 files, lazily
+Inputs:
+- file: path to .pc2/.pc16 file
+- float16: False for PC2 files, True for PC16
+Outputs:
+- header: dictionary with .pc2/.pc16 header data
+- V: lazily indexed view of the animation data (N. Frames x N. Vertices x 3)
+"""
+def readPC2Lazy(file, float16=False):
+	V = PC2View(file, float16)
+	return V.header, V
+
 """
 Reads an specific frame of PC2/PC16 files
 Inputs:
@@ -138,7 +276,7 @@ def readPC2Frame(file, frame, float16=False):
 		f.seek(28)
 		# nSamples = int.from_bytes(f.read(4), 'little')
 		nSamples = unpack('<i', f.read(4))[0]
-		if frame > nSamples:
+		if frame >= nSamples:
 			print("Frame index outside size")
 			print("\tN. frame: " + str(frame))
 			print("\tN. samples: " + str(nSamples))
@@ -149,6 +287,39 @@ def readPC2Frame(file, frame, float16=False):
 		T = np.frombuffer(f.read(size), dtype=dtype).astype(np.float32)
 	return T.reshape(nPoints, 3)
 
+"""
+Reads a range of frames of PC2/PC16 files, contiguous or strided, in one pass
+Inputs:
+- file: path to .pc2/.pc16 file
+- start: first frame to read
+- stop: frame where to stop (excluded), None for the last one
+- step: read every 'step' frames
+- float16: False for PC2 files, True for PC16
+Output:
+- T: mesh vertex data at the selected frames (N. Selected frames x N. Vertices x 3)
+"""
+def readPC2Frames(file, start=0, stop=None, step=1, float16=False):
+	assert file.endswith('.pc2') and not float16 or file.endswith('.pc16') and float16, 'File format not consistent with specified input format'
+	V = PC2View(file, float16)
+	# Copy, so that the file is not kept mapped
+	T = np.array(V.data[start:stop:step], dtype=np.float32)
+	del V
+	return T
+
+"""
+Writes the header of PC2 and PC16 files
+Inputs:
+- f: file opened in binary mode
+- nPoints: number of vertices
+- nSamples: number of frames
+This function assumes 'startFrame' to be 0 and 'sampleRate' to be 1
+"""
+def writePC2Header(f, nPoints, nSamples):
+	headerFormat='<12siiffi'
+	headerStr = pack(headerFormat, b'POINTCACHE2\0',
+					1, nPoints, 0, 1, nSamples)
+	f.write(headerStr)
+
 """
 Writes PC2 and PC16 files
 Inputs:
@@ -160,17 +331,71 @@ NOTE: 16-bit floats lose precision with high values (positive or negative),
 	  we do not recommend using this format for data outside range [-2, 2]
 """
 def writePC2(file, V, float16=False):
+	with PC2Writer(file, V.shape[1], float16) as f:
+		f.write(V)
+
+"""
+Writes PC2 and PC16 files incrementally, frame by frame or in blocks of frames
+A provisional header is written on creation, the number of samples is patched on close
+Inputs:
+- file: path to file (overwrites if exists)
+- nPoints: number of vertices, if None it is taken from the first written frames
+- float16: False for writing as PC2 file, True for PC16
+Usage:
+	with PC2Writer(file, nPoints) as f:
+		f.write(V) # (N. Vertices x 3) or (N. Frames x N. Vertices x 3)
+This function assumes 'startFrame' to be 0 and 'sampleRate' to be 1
+"""
+class PC2Writer:
+	def __init__(self, file, nPoints=None, float16=False):
+		assert file.endswith('.pc2') and not float16 or file.endswith('.pc16') and float16, 'File format not consistent with specified input format'
+		self.dtype = np.float16 if float16 else np.float32
+		self.nPoints = nPoints
+		self.nSamples = 0
+		self.f = open(file, 'wb')
+		writePC2Header(self.f, nPoints or 0, 0)
+
+	def write(self, V):
+		V = np.ascontiguousarray(V, dtype=self.dtype)
+		if V.ndim == 2: V = V[None]
+		if self.nPoints is None: self.nPoints = V.shape[1]
+		assert V.shape[1:] == (self.nPoints, 3), 'Frames must have shape (N. Vertices x 3)'
+		self.f.write(V)
+		self.nSamples += V.shape[0]
+
+	def close(self):
+		if self.f.closed: return
+		# Patch the header
+		self.f.seek(0)
+		writePC2Header(self.f, self.nPoints or 0, self.nSamples)
+		self.f.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.close()
+
+"""
+Creates PC2 and PC16 files and memory-maps their animation data, to be filled in place
+The mapping can be shared with other processes (np.memmap of the same file, offset and shape)
+Inputs:
+- file: path to file (overwrites if exists)
+- nSamples: number of frames
+- nPoints: number of vertices
+- float16: False for PC2 files, True for PC16
+Output:
+- V: writable memory map (N. Frames x N. Vertices x 3), initialized to zero
+"""
+def mapPC2(file, nSamples, nPoints, float16=False):
 	assert file.endswith('.pc2') and not float16 or file.endswith('.pc16') and float16, 'File format not consistent with specified input format'
-	if float16: V = V.astype(np.float16)
-	else: V = V.astype(np.float32)
+	bytes = 2 if float16 else 4
+	dtype = np.float16 if float16 else np.float32
 	with open(file, 'wb') as f:
-		# Create the header
-		headerFormat='<12siiffi'
-		headerStr = pack(headerFormat, b'POINTCACHE2\0',
-						1, V.shape[1], 0, 1, V.shape[0])
-		f.write(headerStr)
-		# Write vertices
-		f.write(V.tobytes())
+		writePC2Header(f, nPoints, nSamples)
+		# Allocate animation data
+		f.truncate(32 + nSamples * nPoints * 3 * bytes)
+	return np.memmap(file, dtype=dtype, mode='r+', offset=32, shape=(nSamples, nPoints, 3))
 
 """
 Reads proposed compressed file format for mesh topology.
@@ -204,4 +429,230 @@ def writeFaceBIN(fname, F):
 	elif not '.' in os.path.basename(fname): fname += '.bin'
 	F = F.astype(np.uint16)
 	with open(fname, 'wb') as f:
-		f.write(F.tobytes())
\ No newline at end of file
+		f.write(F.tobytes())
+"""
+Writes proposed compressed point cache format PCQ
+Each frame is quantized to 16 bits per coordinate within its bounding box, blocks of frames are deflated
+With 'delta' frames of a block share the bounding box and store the difference with the linear prediction
+from the two previous frames, which compresses much better for smooth animations
+The maximum error per coordinate is half of the largest quantization step plus the float32 rounding
+of the decoded values, it is stored in the header as 'maxError' and bounds |decoded - V|
+Inputs:
+- file: path to .pcq file (overwrites if exists)
+- V: 3D animation data (N. Frames x N. Vertices x 3), can be a PC2View or a memory map
+- delta: True to use temporal delta encoding
+- blockSize: number of frames per block, reads decode whole blocks
+"""
+def writePCQ(file, V, delta=True, blockSize=32):
+	assert file.endswith('.pcq'), 'File format not consistent with specified input format'
+	nSamples, nPoints = V.shape[0], V.shape[1]
+	nBlocks = -(-nSamples // blockSize)
+	offsets = np.zeros(nBlocks + 1, np.int64)
+	maxError = 0.
+	with open(file, 'wb') as f:
+		# Header and block table, patched at the end
+		f.write(pack('<12siiiiif', b'POINTCACHEQ\0', 1, nPoints, nSamples, blockSize, delta, maxError))
+		f.write(offsets.tobytes())
+		offsets[0] = f.tell()
+		for b in range(nBlocks):
+			B = np.asarray(V[b * blockSize:(b + 1) * blockSize], np.float64)
+			if delta: lo, hi = B.min(axis=(0, 1), keepdims=True), B.max(axis=(0, 1), keepdims=True)
+			else: lo, hi = B.min(axis=1, keepdims=True), B.max(axis=1, keepdims=True)
+			# float32 box, rounded so that it still covers the data
+			lo32 = lo.astype(np.float32)
+			lo32 = np.where(lo32 > lo, np.nextafter(lo32, np.float32(-np.inf)), lo32)
+			scale = (hi - lo32) / 65535
+			scale32 = scale.astype(np.float32)
+			scale32 = np.where(scale32 < scale, np.nextafter(scale32, np.float32(np.inf)), scale32)
+			q = np.round((B - lo32) / np.where(scale32 > 0, scale32, 1)).astype(np.uint16)
+			if delta:
+				# Wrapping uint16 arithmetic, decoding is exact
+				q = np.concatenate((q[:1], np.diff(q, axis=0)))
+				q = np.concatenate((q[:2], np.diff(q[1:], axis=0)))
+			# Half a quantization step, plus the float32 rounding of the decoded values
+			top = np.float32(max(np.abs(lo32).max(), np.abs(hi).max() + scale32.max()))
+			maxError = max(maxError, float(scale32.max()) / 2 + float(np.spacing(top)))
+			n = B.shape[0]
+			f.write(np.broadcast_to(lo32, (n, 1, 3)).astype(np.float32).tobytes())
+			f.write(np.broadcast_to(scale32, (n, 1, 3)).astype(np.float32).tobytes())
+			f.write(zlib.compress(q.tobytes()))
+			offsets[b + 1] = f.tell()
+		# Stored as float32, rounded up so that it is still a bound
+		maxError32 = np.float32(maxError)
+		if maxError32 < maxError: maxError32 = np.nextafter(maxError32, np.float32(np.inf))
+		f.seek(0)
+		f.write(pack('<12siiiiif', b'POINTCACHEQ\0', 1, nPoints, nSamples, blockSize, delta, maxError32))
+		f.write(offsets.tobytes())
+
+"""
+Reads the header of PCQ files
+Inputs:
+- file: path to .pcq file
+Output:
+- data: dictionary with .pcq header data and block table ('offsets')
+"""
+def readPCQHeader(file):
+	with open(file, 'rb') as f:
+		sign, version, nPoints, nSamples, blockSize, delta, maxError = unpack('<12siiiiif', f.read(36))
+		data = {
+			'sign': sign,
+			'version': version,
+			'nPoints': nPoints,
+			'nSamples': nSamples,
+			'blockSize': blockSize,
+			'delta': bool(delta),
+			'maxError': maxError
+		}
+		nBlocks = -(-nSamples // blockSize)
+		data['offsets'] = np.frombuffer(f.read(8 * (nBlocks + 1)), np.int64)
+	return data
+
+# Decodes a block of PCQ frames as float32
+def _readPCQBlock(f, data, b):
+	f.seek(data['offsets'][b])
+	raw = f.read(data['offsets'][b + 1] - data['offsets'][b])
+	n = min(data['blockSize'], data['nSamples'] - b * data['blockSize'])
+	lo = np.frombuffer(raw, np.float32, n * 3).reshape(n, 1, 3)
+	scale = np.frombuffer(raw, np.float32, n * 3, n * 12).reshape(n, 1, 3)
+	q = np.frombuffer(zlib.decompress(raw[n * 24:]), np.uint16).reshape(n, data['nPoints'], 3)
+	if data['delta']:
+		q = np.concatenate((q[:1], np.cumsum(q[1:], axis=0, dtype=np.uint16)))
+		q = np.cumsum(q, axis=0, dtype=np.uint16)
+	return (lo + q * scale.astype(np.float64)).astype(np.float32)
+
+"""
+Reads PCQ files, decoding only the blocks of the requested frame range
+Inputs:
+- file: path to .pcq file
+- start: first frame to read
+- stop: frame where to stop (excluded), None for the last one
+Output:
+- data: dictionary with .pcq header data and 'V', float32 animation data of the range
+"""
+def readPCQ(file, start=0, stop=None):
+	data = readPCQHeader(file)
+	stop = data['nSamples'] if stop is None else min(stop, data['nSamples'])
+	bs = data['blockSize']
+	V = [np.zeros((0, data['nPoints'], 3), np.float32)]
+	with open(file, 'rb') as f:
+		for b in range(start // bs, -(-stop // bs)):
+			V.append(_readPCQBlock(f, data, b)[max(start - b * bs, 0):stop - b * bs])
+	data['V'] = np.concatenate(V)
+	return data
+
+"""
+Converts PCQ files to PC2 files (e.g. for Blender's MeshCache), block by block
+Inputs:
+- file: path to .pcq file
+- pc2_file: path to .pc2 file (overwrites if exists)
+"""
+def PCQ2PC2(file, pc2_file):
+	data = readPCQHeader(file)
+	with open(file, 'rb') as f, PC2Writer(pc2_file, data['nPoints']) as w:
+		for b in range(len(data['offsets']) - 1):
+			w.write(_readPCQBlock(f, data, b))
+
+"""
+Converts PC16 files to PC2 files (e.g. for Blender's MeshCache), block by block
+An optional per-frame translation is added to the vertex locations on the fly
+Inputs:
+- file: path to .pc16 file
+- pc2_file: path to .pc2 file (overwrites if exists)
+- trans: translation (N. Frames x 3) or (3), None for no translation
+  Frames of 'trans' beyond the ones of the .pc16 file are ignored
+- blockSize: number of frames upcast and written at once
+"""
+def PC162PC2(file, pc2_file, trans=None, blockSize=256):
+	V = PC2View(file, True)
+	if trans is not None:
+		trans = np.reshape(trans, (-1, 3))
+		if len(trans) > 1:
+			assert len(trans) >= len(V), 'Translation has fewer frames than the PC16 file'
+			trans = trans[:len(V)]
+		trans = np.broadcast_to(trans, (len(V), 3))
+	with PC2Writer(pc2_file, V.shape[1]) as w:
+		for i in range(0, len(V), blockSize):
+			block = V[i:i + blockSize]
+			if trans is not None:
+				block += trans[i:i + blockSize, None]
+			w.write(block)
+	del V
+
+"""
+Writes binary STL files
+Inputs:
+- file: path to .stl file (overwrites if exists)
+- V: 3D vertices
+- F: 3D faces, polygons are triangulated as fans
+"""
+def writeSTL(file, V, F):
+	T = np.asarray(V, np.float32)[_triangulate(F)]
+	N = np.cross(T[:, 1] - T[:, 0], T[:, 2] - T[:, 0])
+	N /= np.maximum(np.linalg.norm(N, axis=-1, keepdims=True), 1e-12)
+	data = np.zeros(len(T), [('normal', '<f4', 3), ('vertices', '<f4', (3, 3)), ('attribute', '<u2')])
+	data['normal'] = N
+	data['vertices'] = T
+	with open(file, 'wb') as f:
+		f.write(pack('<80sI', b'Binary STL', len(T)))
+		f.write(data.tobytes())
+
+# Fan triangulation of (possibly ragged) polygons, as (N. Triangles x 3) indices
+# Already flat faces are given as F = flat indices and n = number of vertices per face
+def _triangulate(F, n=None):
+	if n is None and isinstance(F, np.ndarray) and F.ndim == 2:
+		return np.concatenate([F[:, [0, i, i + 1]] for i in range(1, F.shape[1] - 1)]) if F.shape[1] > 2 else np.zeros((0, 3), np.int64)
+	idx, n = flattenFaces(F) if n is None else (np.asarray(F, np.int64), np.asarray(n, np.int64))
+	t = np.maximum(n - 2, 0)
+	poly = np.repeat(np.arange(len(n)), t)
+	# first loop of each triangle's polygon and triangle index within it
+	s = (np.cumsum(n) - n)[poly]
+	k = np.arange(len(poly)) - (np.cumsum(t) - t)[poly] + 1
+	return np.stack((idx[s], idx[s + k], idx[s + k + 1]), -1)
+
+"""
+Traces the volume swept by animated meshes and writes it as a binary STL file
+Every 'step' frames of each mesh are merged, vertices closer than ~'dist' are merged
+through a voxel hash (cells of size 'dist', merged vertices are averaged)
+Inputs:
+- file: path to .stl file (overwrites if exists)
+- meshes: list of (path to .pc2 file, faces) tuples, one per mesh, or of (path to .pc2 file, flat indices,
+  number of vertices per face) tuples for already flat faces (see flattenFaces)
+- zrot: rotation around Z-axis (radians) applied to the whole trace
+- start, stop, step: frames of the caches to trace, as in readPC2Frames
+- dist: merge distance
+"""
+def traceSTL(file, meshes, zrot=0, start=0, stop=None, step=5, dist=0.02):
+	V, F = [], []
+	nV = 0
+	for pc2_file, *faces in meshes:
+		frames = readPC2Frames(pc2_file, start, stop, step)
+		if not len(frames): continue
+		tris = _triangulate(*faces)
+		# faces of all the frames, over the stacked vertices
+		tris = (tris[None] + frames.shape[1] * np.arange(len(frames))[:, None, None]).reshape(-1, 3)
+		v, tris = _mergeVoxels(frames.reshape(-1, 3), tris, dist)
+		V.append(v)
+		F.append(tris + nV)
+		nV += len(v)
+	V = np.concatenate(V) if V else np.zeros((0, 3), np.float32)
+	F = np.concatenate(F) if F else np.zeros((0, 3), np.int64)
+	c, s = np.cos(zrot), np.sin(zrot)
+	V = V @ np.array([[c, -s, 0], [s, c, 0], [0, 0, 1]], np.float32).T
+	writeSTL(file, V, F)
+
+# Merges vertices in the same voxel, drops the faces that collapse or repeat
+def _mergeVoxels(V, F, dist):
+	key = np.floor(V / dist).astype(np.int64)
+	key -= key.min(0)
+	dims = key.max(0) + 1
+	_, inv = np.unique((key[:, 0] * dims[1] + key[:, 1]) * dims[2] + key[:, 2], return_inverse=True)
+	inv = inv.ravel()
+	count = np.bincount(inv)
+	V = np.stack([np.bincount(inv, V[:, i]) / count for i in range(3)], -1).astype(np.float32)
+	F = inv[F]
+	F = F[(F[:, 0] != F[:, 1]) & (F[:, 1] != F[:, 2]) & (F[:, 2] != F[:, 0])]
+	# faces as single codes while they fit in 63 bits
+	S = np.sort(F, axis=1)
+	S = (S[:, 0] * len(V) + S[:, 1]) * len(V) + S[:, 2] if len(V) < 2 ** 21 else S
+	F = F[np.sort(np.unique(S, axis=0, return_index=True)[1])]
+	return V, F
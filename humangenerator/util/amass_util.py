@@ -2,19 +2,51 @@ import numpy as np
 import glob
 import os
 import random
-from .IO import readPC2, writePC2
-import bpy, sys, torch
+from .IO import readPC2Header, PC2Writer
+import bpy, sys
 from .blender_util import mesh_cache
+from data_folder.smpl.smpl_np import SMPLHModel
 from typing import Tuple
 
-def bodyCache(path_cache, sample, info, ob, body_model, num_betas, num_dmpls):
+def bodyCache(path_cache, sample, info, ob, body_model, num_betas, num_dmpls, chunk_size=256):
     print("Processing Body Cache")
 
     pc2_path = os.path.join(path_cache, sample + '.pc2')
 
-    V = np.zeros((info['poses'].shape[1], 6890, 3), np.float32)
+    if not os.path.isfile(pc2_path):
+        # evaluate fixed-size windows streamed into the PC2 payload, memory does not grow with the sequence
+        bdata = {k: info[k] for k in ['poses', 'trans', 'betas', 'dmpls']}
+        time_length = len(bdata['trans'])
+        tmp_path = pc2_path[:-4] + '_tmp.pc2'
+        with PC2Writer(tmp_path) as V:
+            for start in range(0, time_length, chunk_size):
+                window = dict(bdata, **{k: bdata[k][start:start + chunk_size] for k in ['poses', 'trans', 'dmpls']})
+                V.write(_body_model_forward(window, body_model, num_betas, num_dmpls))
+        nPoints = V.nPoints
+        print("Writing PC2 file...")
+        os.replace(tmp_path, pc2_path)
+    else:
+        nPoints = readPC2Header(pc2_path)['nPoints']
+
+    if nPoints != len(ob.data.vertices):
+        sys.stderr.write("ERROR IN THE VERTEX COUNT FOR THE BODY!!!!!")
+        sys.stderr.flush()
 
-    bdata = info
+    mesh_cache(ob, pc2_path)
+    bpy.ops.object.shade_smooth()
+
+def _body_model_forward(bdata, body_model, num_betas: int, num_dmpls: int) -> np.array:
+    """ evaluates the parametric model over a sequence, or a window of it
+
+    :param bdata: AMASS sequence data. Type: dict.
+    :param body_model: parametric model from _load_parametric_body_model. Type: SMPLHModel or BodyModel.
+    :return: vertices of the sequence. Type: array of shape (frames, vertices, 3).
+    """
+    if isinstance(body_model, SMPLHModel):
+        return body_model.forward(bdata['poses'], bdata['trans'], bdata['betas'][:num_betas],
+                                  bdata['dmpls'][:, :num_dmpls])[0]
+
+    import torch
     time_length = len(bdata['trans'])
     comp_device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
     body_params = {
@@ -30,20 +62,7 @@ def bodyCache(path_cache, sample, info, ob, body_model, num_betas, num_dmpls):
     body_trans_root = body_model(
         **{k: v for k, v in body_params.items() if k in ['pose_body', 'betas', 'pose_hand', 'dmpls',
                                                          'trans', 'root_orient']})
-    if not os.path.isfile(pc2_path):
-        V = body_trans_root.v.data.cpu().numpy()
-        print("Writing PC2 file...")
-        writePC2(pc2_path, V)
-    else:
-        V = readPC2(pc2_path)['V']
-
-    if V.shape[1] != len(ob.data.vertices):
-        sys.stderr.write("ERROR IN THE VERTEX COUNT FOR THE BODY!!!!!")
-        sys.stderr.flush()
-
-    mesh_cache(ob, pc2_path)
-    bpy.ops.object.shade_smooth()
-    return body_trans_root
+    return body_trans_root.v.data.cpu().numpy()
 
 def loadInfo(sequence_path):
 
@@ -96,18 +115,25 @@ def _get_sequence_path(supported_mocap_datasets: dict, used_sub_dataset_id: str,
                 "supported datasets: {}".format([key for key, value in supported_mocap_datasets.items()]))
 
 def _load_parametric_body_model(data_path: str, used_body_model_gender: str, num_betas: int,
-                                num_dmpls: int) -> Tuple["BodyModel", np.array]:
+                                num_dmpls: int, backend: str = "numpy") -> Tuple["SMPLHModel", np.array]:
     """ loads the parametric model that is used to generate the mesh object
 
+    :param backend: "numpy" for the torch-free SMPLHModel, "torch" for human_body_prior's BodyModel. Type: string.
     :return:  parametric model. Type: tuple.
     """
-    import torch
-    from human_body_prior.body_model.body_model import BodyModel
-
     bm_path = os.path.join(data_path, 'body_models', 'smplh', used_body_model_gender, 'model.npz')  # body model
     dmpl_path = os.path.join(data_path, 'body_models', 'dmpls', used_body_model_gender, 'model.npz')  # deformation model
     if not os.path.exists(bm_path) or not os.path.exists(dmpl_path):
         raise Exception("Parametric Body model doesn't exist, please follow download instructions section in AMASS Example")
+    if backend == "numpy":
+        body_model = SMPLHModel(bm_path, dmpl_path, num_betas, num_dmpls)
+        return body_model, body_model.faces
+    elif backend != "torch":
+        raise Exception("Unknown body model backend {}, choose either numpy or torch".format(backend))
+
+    import torch
+    from human_body_prior.body_model.body_model import BodyModel
+
     comp_device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
     body_model = BodyModel(bm_path=bm_path, num_betas=num_betas, num_dmpls=num_dmpls, path_dmpl=dmpl_path).to(comp_device)
     faces = body_model.f.detach().cpu().numpy()
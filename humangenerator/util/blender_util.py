@@ -1,6 +1,6 @@
 import os
 import bpy
-from humangenerator.util.IO import readOBJ, readPC2, writePC2
+from humangenerator.util.IO import readOBJ, readPC2, readPC2Frames, writePC2, traceSTL, flattenFaces
 import numpy as np
 import bmesh
 import sys
@@ -106,33 +106,34 @@ def createBPYObj(V, F, Vt=None, Ft=None, name='new_obj'):
     bpy.context.collection.objects.link(ob)
     select(ob)
     mesh = bpy.context.object.data
-    bm = bmesh.new()
-    # Vertices
-    for v in V:
-        bm.verts.new(v)
-    bm.verts.ensure_lookup_table()
-    # Faces
-    for f in F:
-        v = [bm.verts[i] for i in f]
-        bm.faces.new(v)
-    bm.to_mesh(mesh)
-    bm.free()
+    # Vertices, loops and faces in bulk (faces keep the order and winding of F)
+    loops, loop_total = flattenFaces(F, np.int32)
+    loop_start = np.zeros(len(loop_total), np.int32)
+    np.cumsum(loop_total[:-1], out=loop_start[1:])
+    mesh.vertices.add(len(V))
+    mesh.vertices.foreach_set('co', np.asarray(V, np.float32).ravel())
+    mesh.loops.add(len(loops))
+    mesh.loops.foreach_set('vertex_index', loops)
+    mesh.polygons.add(len(loop_total))
+    mesh.polygons.foreach_set('loop_start', loop_start)
+    if bpy.app.version < (4, 0, 0):
+        # derived from loop_start (read-only) in newer versions
+        mesh.polygons.foreach_set('loop_total', loop_total)
+    mesh.update(calc_edges=True)
     # UV Map
     if not Vt is None:
-        # Create UV layer
-        ob.data.uv_layers.new()
-        # Assign UV coords
-        iloop = 0
-        for f in Ft:
-            for i in f:
-                ob.data.uv_layers['UVMap'].data[iloop].uv = Vt[i]
-                iloop += 1
+        # Create UV layer and assign UV coords, one per loop
+        uv_layer = ob.data.uv_layers.new()
+        uv_loops = flattenFaces(Ft)[0]
+        uv_layer.data.foreach_set('uv', np.asarray(Vt, np.float32)[uv_loops, :2].ravel())
     return ob
 
 
-
 def convert_meshcache(ob: bpy.ops.object, offset=0):
     # Converts a MeshCache or Cloth modifiers to ShapeKeys
+    # (the operator applies to the active object, existing shapekeys are kept)
+    shape_keys = bpy.context.object.data.shape_keys
+    first = 1 if shape_keys is None else len(shape_keys.key_blocks)
     bpy.context.scene.frame_current = bpy.context.scene.frame_start
     for frame in range(bpy.context.scene.frame_end + 1):
         bpy.context.scene.frame_current = frame
@@ -140,26 +141,53 @@ def convert_meshcache(ob: bpy.ops.object, offset=0):
         # for alembic files converted to PC2 and loaded as MeshCache
         bpy.ops.object.modifier_apply_as_shapekey(keep_modifier=True, modifier="MeshCache")
 
-    # loop through shapekeys and add as keyframe per frame
+    # one shapekey per frame, keyed on at its frame only
     # https://blender.stackexchange.com/q/149045/87258
+    keyframe_shapekeys(bpy.context.object.data.shape_keys, first)
     bpy.context.scene.frame_current = bpy.context.scene.frame_start
-    for frame in range(bpy.context.scene.frame_end + 1):
-        bpy.context.scene.frame_current = frame
-
-        shapekey = bpy.data.shape_keys[-1]
-        for i, keyblock in enumerate(shapekey.key_blocks):
-            if keyblock.name != "Basis":
-                curr = i - 1
-                if curr != frame:
-                    keyblock.value = 0
-                    keyblock.keyframe_insert("value", frame=frame)
-                else:
-                    keyblock.value = 1
-                    keyblock.keyframe_insert("value", frame=frame)
 
     bpy.ops.object.modifier_remove(modifier="MeshCache")
 
 
+def shapekeys_from_pc2(ob, cache):
+    # Same shapekeys as mesh_cache + convert_meshcache, written directly from the PC2 data
+    if ob.data.shape_keys is None:
+        ob.shape_key_add(name="Basis", from_mix=False)
+    # existing shapekeys are kept and not keyed again
+    first = len(ob.data.shape_keys.key_blocks)
+    for V in readPC2Frames(cache, 0, bpy.context.scene.frame_end + 1):
+        keyblock = ob.shape_key_add(name="MeshCache", from_mix=False)
+        keyblock.data.foreach_set("co", V.ravel())
+    keyframe_shapekeys(ob.data.shape_keys, first)
+
+
+def keyframe_shapekeys(shapekey, first=1):
+    # Keys the i-th keyblock, from index first on (1 skips Basis), to 1 at frame i - first
+    # and to 0 at any other frame, as a step function: one fcurve per keyblock with (at most)
+    # 3 constant keyframes. The keyblocks before first are left untouched
+    if shapekey.animation_data is None:
+        shapekey.animation_data_create()
+    if shapekey.animation_data.action is None:
+        shapekey.animation_data.action = bpy.data.actions.new(shapekey.name + "Action")
+    fcurves = shapekey.animation_data.action.fcurves
+    frame_end = bpy.context.scene.frame_end
+    for i, keyblock in enumerate(shapekey.key_blocks[first:], first):
+        curr = i - first
+        frames = [f for f in (curr - 1, curr, curr + 1) if 0 <= f <= frame_end] or [0]
+        co = np.array([(f, f == curr) for f in frames], np.float32)
+
+        data_path = 'key_blocks["{}"].value'.format(keyblock.name)
+        fcurve = fcurves.find(data_path)
+        if fcurve is not None:
+            fcurves.remove(fcurve)
+        fcurve = fcurves.new(data_path)
+        fcurve.keyframe_points.add(len(co))
+        fcurve.keyframe_points.foreach_set("co", co.ravel())
+        for keyframe in fcurve.keyframe_points:
+            keyframe.interpolation = 'CONSTANT'
+        fcurve.update()
+
+
 def setMaterial(path_sample, ob, sample, garment, texture):
     mat = bpy.data.materials.new(name=sample + '_' + garment + '_Material')
     mat.use_nodes = True
@@ -287,6 +315,35 @@ def export_stl_data(filepath, filename, lobs, zrot):
     bpy.ops.object.delete()
 
 
+def export_stl_trace(filepath, filename, lobs, zrot, step=5):
+    """
+    Same trace as export_stl_data, computed in NumPy from the point caches of the meshes
+    (see IO.traceSTL), without evaluating the scene. Only the topology, the cache paths
+    and the frame range are read from Blender. Falls back to export_stl_data if a mesh
+    is not animated by a plain MeshCache modifier (e.g. blendshapes).
+    """
+    scene = bpy.context.scene
+    meshes = []
+    for ob in lobs:
+        if ob.type != 'MESH':
+            continue
+        mod = ob.modifiers.get('MeshCache')
+        if mod is None or mod.cache_format != 'PC2' or mod.frame_start != 0 or mod.frame_scale != 1:
+            return export_stl_data(filepath, filename, lobs, zrot)
+        meshes.append((bpy.path.abspath(mod.filepath), *_mesh_faces(ob.data)))
+    traceSTL(os.path.join(filepath, filename, filename + ".stl"), meshes, zrot,
+             scene.frame_start, scene.frame_end + 1, step)
+
+
+# Polygons of a mesh as flat vertex indices and number of vertices per polygon
+def _mesh_faces(me):
+    loops = np.empty(len(me.loops), np.int32)
+    me.loops.foreach_get('vertex_index', loops)
+    loop_total = np.empty(len(me.polygons), np.int32)
+    me.polygons.foreach_get('loop_total', loop_total)
+    return loops, loop_total
+
+
 def write_pkl_data(filepath, filename, arm_ob, ob, info, frame_step=1, write_verts=False):
     bpy.context.scene.frame_current = bpy.context.scene.frame_start
     N = int((bpy.context.scene.frame_end - bpy.context.scene.frame_start + 1) / frame_step)
@@ -314,8 +371,11 @@ def write_pkl_data(filepath, filename, arm_ob, ob, info, frame_step=1, write_ver
     select(ob)
     dg = bpy.context.evaluated_depsgraph_get()
 
-    cnt = 0
-    for f in range(bpy.context.scene.frame_start, bpy.context.scene.frame_end + 1):
+    # flat buffers filled through foreach_get, reused across frames
+    co = np.empty(n_verts * 3, np.float32)
+    heads = np.empty((n_bones + 1) * 3, np.float32)
+    frames = range(bpy.context.scene.frame_start, bpy.context.scene.frame_end + 1, frame_step)[:N]
+    for cnt, f in enumerate(frames):
         sys.stdout.write('\r' + str(f) + '/' + str(N * frame_step))
         sys.stdout.flush()
         bpy.context.scene.frame_current = f
@@ -323,20 +383,107 @@ def write_pkl_data(filepath, filename, arm_ob, ob, info, frame_step=1, write_ver
 
         d['frame'].append(f)
 
-        select(ob)
-        tmp = ob.evaluated_get(dg)
-        me = tmp.to_mesh()
         if write_verts:
-            d['verts'][cnt] = np.reshape([ob.matrix_world @ v.co for v in me.vertices], (n_verts, 3))
-
-        select(arm_ob)
-        d['bones'][cnt] = np.reshape([arm_ob.matrix_world @ bone.head for bone in arm_ob.pose.bones[1:]], (n_bones, 3))
-        cnt += 1
+            tmp = ob.evaluated_get(dg)
+            me = tmp.to_mesh()
+            me.vertices.foreach_get('co', co)
+            tmp.to_mesh_clear()
+            d['verts'][cnt] = _transform(ob.matrix_world, co.reshape((n_verts, 3)))
+
+        arm_ob.pose.bones.foreach_get('head', heads)
+        d['bones'][cnt] = _transform(arm_ob.matrix_world, heads.reshape((n_bones + 1, 3))[1:])
+
+    _dump_pkl(filepath, filename, d)
+
+
+# SMPL joints, in the order of the SMPL model (pose bones are named '<gender>_avg_<joint>')
+SMPL_JOINTS = ['Pelvis', 'L_Hip', 'R_Hip', 'Spine1', 'L_Knee', 'R_Knee', 'Spine2', 'L_Ankle', 'R_Ankle', 'Spine3',
+               'L_Foot', 'R_Foot', 'Neck', 'L_Collar', 'R_Collar', 'Head', 'L_Shoulder', 'R_Shoulder', 'L_Elbow',
+               'R_Elbow', 'L_Wrist', 'R_Wrist', 'L_Hand', 'R_Hand']
+
+
+def write_pkl_data_analytic(filepath, filename, arm_ob, ob, info, smpl, poses, trans, beta, frame_step=1,
+                            write_verts=False, pc2_path=None):
+    """
+    Same output as write_pkl_data, without evaluating the scene frame by frame.
+    Bone heads are the posed SMPL joints (smpl.forward_joints) and vertices are read
+    from the body PC2 cache (pc2_path), mapped with the world matrix of ob.
+    Only the (static) world matrices, frame range and bone order are read from Blender.
+    Vertices of a body without cache depend on the mesh-space offset of the imported body
+    (origin_set, FBX scale), so in that case the scene is evaluated with write_pkl_data.
+    :param smpl: SMPLModel of the body
+    :param poses: pose of each keyframe (T x 72)
+    :param trans: location of the Pelvis bone at each keyframe (T x 3), as given to apply_trans_pose_shape
+    :param beta: shape of the body
+    :param pc2_path: body cache loaded by the MeshCache modifier of ob, None if the body is not cached
+    UNVERIFIED: the output has not been compared with write_pkl_data on a Blender export.
+    It assumes that the pose bones have an identity rest orientation, that the Pelvis
+    location acts in armature space and that pose.bones[0] is the root. Before using it,
+    export a Cloth3D and an AMASS sample (with cache) with both functions and compare the
+    two pkl files with compare_pkl_data. It is not exposed by generate_sequence.py until then.
+    """
+    if write_verts and pc2_path is None:
+        return write_pkl_data(filepath, filename, arm_ob, ob, info, frame_step, write_verts)
+    scene = bpy.context.scene
+    N = int((scene.frame_end - scene.frame_start + 1) / frame_step)
+    n_bones = len(arm_ob.pose.bones) - 1
+    # keyframes hold their value outside of the animation
+    frames = np.arange(scene.frame_start, scene.frame_end + 1, frame_step)[:N]
+    keys = np.clip(frames, 0, len(poses) - 1)
+    d = {
+        'frame': frames.tolist(),
+        'bones': np.zeros((N, n_bones, 3), np.float32),
+        'info': info
+    }
+    if write_verts:
+        d['verts'] = np.zeros((N, len(ob.data.vertices), 3), np.float32)
+    d.update({
+        'sf': scene.frame_start,
+        'ef': scene.frame_end + 1,
+        'nframes': frame_step
+    })
+    poses = np.reshape(poses, (-1, 72))[keys]
+    trans = np.reshape(trans, (-1, 3))[keys]
+
+    joints = [SMPL_JOINTS.index(bone.name.split('_avg_')[-1]) for bone in arm_ob.pose.bones[1:]]
+    G = smpl.forward_joints(poses, trans, beta)
+    d['bones'][:] = _transform(arm_ob.matrix_world, G[:, joints, :3][..., 3])
 
+    if write_verts:
+        # the MeshCache overwrites the mesh coordinates of ob
+        V = readPC2Frames(pc2_path)
+        d['verts'][:] = _transform(ob.matrix_world, V[np.clip(frames, 0, len(V) - 1)])
+
+    _dump_pkl(filepath, filename, d)
+
+
+def compare_pkl_data(file_a, file_b):
+    """
+    Compares two pkl files written by write_pkl_data/write_pkl_data_analytic
+    :return: whether the frames match and the max absolute difference of bones and verts (None if missing)
+    """
+    with open(file_a, 'rb') as f:
+        a = pkl.load(f)
+    with open(file_b, 'rb') as f:
+        b = pkl.load(f)
+    return {
+        'frame': list(a['frame']) == list(b['frame']),
+        'bones': float(np.abs(a['bones'] - b['bones']).max()) if len(a['bones']) else 0.0,
+        'verts': float(np.abs(a['verts'] - b['verts']).max()) if 'verts' in a and 'verts' in b else None
+    }
+
+
+def _dump_pkl(filepath, filename, d):
     if not os.path.exists(os.path.join(filepath, filename)):
         os.makedirs(os.path.join(filepath, filename))
     filepath = os.path.join(filepath, filename, filename + ".pkl")
 
     out = open(filepath, 'wb')
     pkl.dump(d, out)
-    out.close()
\ No newline at end of file
+    out.close()
+
+
+# Applies a 4x4 (world) matrix to an array of points (N x 3)
+def _transform(matrix, points):
+    M = np.array(matrix, np.float32)
+    return points @ M[:3, :3].T + M[:3, 3]
@@ -1,23 +1,127 @@
 import numpy as np
 import scipy.io as sio
 from math import cos, sin
-from .blender_util import readOBJ, createBPYObj, setMaterial, mesh_cache, convert_meshcache
-import os, sys
-from .IO import readPC2, writePC2
+from .blender_util import createBPYObj, setMaterial, mesh_cache, convert_meshcache
+import os, sys, json, time
+from .IO import readOBJCached, readPC2Header, mapPC2, PC162PC2, flattenFaces
+from data_folder.smpl.smpl_np import forward_parallel
 import bpy
 
-def loadInfo(path: str):
+def loadInfo(path: str, cache_path: str = None):
     '''
     this function should be called instead of direct sio.loadmat
     as it cures the problem of not properly recovering python dictionaries
     from mat files. It calls the function check keys to cure all entries
     which are still mat-objects
+    If cache_path is given, the cured dictionary is cached as cache_path + '.bin'
+    (raw array data) and cache_path + '.json' (everything else), and read from there
+    as long as path keeps the same size and modification time
     '''
+    if cache_path is not None:
+        key = _info_key(path)
+        data = _read_info_cache(cache_path, key)
+        if data is not None:
+            return data
     data = sio.loadmat(path, struct_as_record=False, squeeze_me=True)
     del data['__globals__']
     del data['__header__']
     del data['__version__']
-    return _check_keys(data)
+    data = _check_keys(data)
+    if cache_path is not None:
+        _write_info_cache(cache_path, key, data)
+    return data
+
+def _info_key(path):
+    st = os.stat(path)
+    return {'path': os.path.abspath(path), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+def _read_info_cache(cache_path, key):
+    if not os.path.isfile(cache_path + '.json'):
+        return None
+    with open(cache_path + '.json') as f:
+        meta = json.load(f)
+    if meta['key'] != key:
+        return None
+    with open(cache_path + '.bin', 'rb') as f:
+        buffer = bytearray(f.read())
+    return _decode_info(meta['info'], buffer)
+
+def _write_info_cache(cache_path, key, data):
+    chunks = []
+    try:
+        meta = {'key': key, 'info': _encode_info(data, chunks)}
+    except TypeError:
+        # entries with no plain array/JSON counterpart, not cached
+        return
+    # array data first, the JSON (with the key) marks the cache as complete
+    with open(cache_path + '_tmp.bin', 'wb') as f:
+        f.write(b''.join(chunks))
+    os.replace(cache_path + '_tmp.bin', cache_path + '.bin')
+    with open(cache_path + '_tmp.json', 'w') as f:
+        json.dump(meta, f)
+    os.replace(cache_path + '_tmp.json', cache_path + '.json')
+
+def _encode_info(elem, chunks):
+    '''
+    Splits a cured dictionary into raw array data (appended to 'chunks', 16-byte aligned)
+    and a JSON tree describing it. MATLAB field names start with a letter, so
+    '__npy__' and '__object__' cannot clash with actual entries
+    '''
+    if isinstance(elem, dict):
+        return {k: _encode_info(v, chunks) for k, v in elem.items()}
+    if isinstance(elem, list):
+        return [_encode_info(v, chunks) for v in elem]
+    if isinstance(elem, np.ndarray) and elem.dtype == object:
+        return {'__object__': [_encode_info(v, chunks) for v in elem.ravel()], 'shape': elem.shape}
+    if isinstance(elem, (np.ndarray, np.generic)):
+        a = np.asarray(elem)
+        fortran = a.ndim > 1 and a.flags['F_CONTIGUOUS'] and not a.flags['C_CONTIGUOUS']
+        offset = sum(map(len, chunks))
+        data = a.tobytes('F' if fortran else 'C')
+        chunks.append(data + bytes(-len(data) % 16))
+        return {'__npy__': offset, 'dtype': a.dtype.str, 'shape': a.shape, 'fortran': fortran,
+                'scalar': isinstance(elem, np.generic)}
+    if elem is None or isinstance(elem, (str, bool, int, float)):
+        return elem
+    raise TypeError(type(elem))
+
+def _decode_info(elem, buffer):
+    if isinstance(elem, list):
+        return [_decode_info(v, buffer) for v in elem]
+    if not isinstance(elem, dict):
+        return elem
+    if '__npy__' in elem:
+        dtype = np.dtype(elem['dtype'])
+        a = np.frombuffer(buffer, dtype, int(np.prod(elem['shape'])), elem['__npy__'])
+        a = a.reshape(elem['shape'], order='F' if elem['fortran'] else 'C')
+        return a[()] if elem['scalar'] else a
+    if '__object__' in elem:
+        a = np.empty(len(elem['__object__']), object)
+        a[:] = [_decode_info(v, buffer) for v in elem['__object__']]
+        return a.reshape(elem['shape'])
+    return {k: _decode_info(v, buffer) for k, v in elem.items()}
+
+def benchmark_loadInfo(path_samples: str, path_cache: str, samples: list = None):
+    '''
+    Times loadInfo over a Cloth3D split: without cache, cold (first load, writing
+    the cache to path_cache) and warm (from the cache). Existing caches are removed
+    before the cold pass
+    Returns the total seconds of each pass and the number of samples
+    '''
+    samples = samples or sorted(os.listdir(path_samples))
+    os.makedirs(path_cache, exist_ok=True)
+    for sample in samples:
+        for ext in ('.bin', '.json'):
+            if os.path.isfile(os.path.join(path_cache, sample + '_info' + ext)):
+                os.remove(os.path.join(path_cache, sample + '_info' + ext))
+    times = {'samples': len(samples)}
+    for mode in ('loadmat', 'cold', 'warm'):
+        start = time.perf_counter()
+        for sample in samples:
+            loadInfo(os.path.join(path_samples, sample, 'info.mat'),
+                     None if mode == 'loadmat' else os.path.join(path_cache, sample + '_info'))
+        times[mode] = time.perf_counter() - start
+    return times
 
 def _check_keys(dict):
     '''
@@ -38,7 +142,7 @@ def _todict(matobj):
         elem = matobj.__dict__[strg]
         if isinstance(elem, sio.matlab.mio5_params.mat_struct):
             dict[strg] = _todict(elem)
-        elif isinstance(elem, np.ndarray) and np.any([isinstance(item, sio.matlab.mio5_params.mat_struct) for item in elem]):
+        elif isinstance(elem, np.ndarray) and elem.dtype == object and any(isinstance(item, sio.matlab.mio5_params.mat_struct) for item in elem):
             dict[strg] = [None] * len(elem)
             for i,item in enumerate(elem):
                 if isinstance(item, sio.matlab.mio5_params.mat_struct):
@@ -105,6 +209,25 @@ def mesh2UV(F, Ft):
     # m2uv = {k:list(v) for k,v in m2uv.items()}
     return m2uv
 
+"""
+Mesh to UV map, as arrays
+Same correspondences as mesh2UV, in CSR layout: the UV vertices of 3D mesh vertex 'v'
+are uv[ptr[v]:ptr[v + 1]] (sorted, empty for vertices not referenced by F)
+n_verts sets the number of rows, never less than max(F) + 1
+"""
+def mesh2UV_csr(F, Ft, n_verts=None):
+    v = flattenFaces(F)[0]
+    vt = flattenFaces(Ft)[0]
+    # at least one row per vertex referenced by F
+    n_refs = int(v.max()) + 1 if len(v) else 0
+    n_verts = n_refs if n_verts is None else max(n_verts, n_refs)
+    # unique (v, vt) pairs, sorted by v then vt
+    pairs = np.unique(v * (int(vt.max()) + 1 if len(vt) else 1) + vt, return_index=True)[1]
+    v, uv = v[pairs], vt[pairs]
+    ptr = np.zeros(n_verts + 1, np.int64)
+    np.cumsum(np.bincount(v, minlength=n_verts), out=ptr[1:])
+    return ptr, uv
+
 # Maps UV coordinates to texture space (pixel)
 IMG_SIZE = 2048 # all image textures have this squared size
 def uv_to_pixel(vt):
@@ -113,13 +236,21 @@ def uv_to_pixel(vt):
     # Note that Blender graphic engines invert vertical axis
     return int(px[0]), int(IMG_SIZE - px[1]) # texel X, texel Y
 
+# Batched uv_to_pixel, maps UV coordinates (N x 2) to texels (N x 2)
+def uv_to_pixels(vt):
+    px = np.asarray(vt) * IMG_SIZE
+    px %= IMG_SIZE
+    px[:, 1] = IMG_SIZE - px[:, 1]
+    return px.astype(np.int64) # texel X, texel Y
+
 
 def loadGarment(path_sample, path_cache, sample, garment, info):
     print("Processing Garment Cache")
     print(f"Loading {garment}")
     texture = info['outfit'][garment]['texture']
-    # Read OBJ file and create BPY object
-    V, F, Vt, Ft = readOBJ(os.path.join(path_sample, sample, garment + '.obj'))
+    # Read OBJ file (parsed once, then from the view_cache folder) and create BPY object
+    V, F, Vt, Ft = readOBJCached(os.path.join(path_sample, sample, garment + '.obj'),
+                                 os.path.join(path_cache, sample + '_' + garment + '_obj.npz'))
     ob = createBPYObj(V, F, Vt, Ft, name=sample + '_' + garment)
     # z-rot
     ob.rotation_euler[2] = info['zrot']
@@ -130,21 +261,16 @@ def loadGarment(path_sample, path_cache, sample, garment, info):
                             )
     if not os.path.isfile(pc2_path):
         # Convert PC16 to PC2 (and move to view_cache folder)
-        # Add trans to vertex locations
+        # Add trans to vertex locations, single frame samples are stored as flat vectors
         pc16_path = os.path.join(path_sample, sample, garment + '.pc16')
-        V = readPC2(pc16_path, True)['V']
-        for i in range(V.shape[0]):
-            sys.stdout.write('\r' + str(i + 1) + '/' + str(V.shape[0]))
-            sys.stdout.flush()
-            if V.shape[0] > 1:
-                V[i] += info['trans'][:, i][None]
-            else:
-                V[i] += info['trans'][:][None]
-        writePC2(pc2_path, V)
+        tmp_path = pc2_path[:-4] + '_tmp.pc2'
+        PC162PC2(pc16_path, tmp_path, info['trans'].reshape((3, -1)).T)
+        nPoints = readPC2Header(tmp_path)['nPoints']
+        os.replace(tmp_path, pc2_path)
     else:
-        V = readPC2(pc2_path)['V']
+        nPoints = readPC2Header(pc2_path)['nPoints']
 
-    if V.shape[1] != len(ob.data.vertices):
+    if nPoints != len(ob.data.vertices):
         sys.stderr.write("ERROR IN THE VERTEX COUNT!!!!!")
         sys.stderr.flush()
 
@@ -159,7 +285,7 @@ def loadGarment(path_sample, path_cache, sample, garment, info):
     print(f"\nLoaded {garment}.\n")
 
 
-def bodyCache(path_cache, sample, info, ob, smpl):
+def bodyCache(path_cache, sample, info, ob, smpl, threads=1):
     print("Processing Body Cache")
     pc2_path = os.path.join(path_cache, sample + '.pc2')
     if not os.path.isfile(pc2_path):
@@ -167,30 +293,23 @@ def bodyCache(path_cache, sample, info, ob, smpl):
         print("Computing body sequence...")
         print("")
         gender = 'm' if info['gender'] else 'f'
-        if len(info['poses'].shape)>1:
-            N = info['poses'].shape[1]
-        else:
-            N = 1
-        V = np.zeros((N, 6890, 3), np.float32)
-        for i in range(N):
-            sys.stdout.write('\r' + str(i + 1) + '/' + str(N))
-            sys.stdout.flush()
-            s = info['shape']
-            if N == 1:
-                p = info['poses'][:].reshape((24, 3))
-                t = info['trans'][:].reshape((3,))
-            else:
-                p = info['poses'][:, i].reshape((24, 3))
-                t = info['trans'][:, i].reshape((3,))
-            v, j = smpl[gender].set_params(pose=p, beta=s, trans=t)
-            V[i] = v - j[0:1]
-        print("")
+        # whole sequence at once, single frame samples are stored as flat vectors
+        poses = info['poses'].reshape((72, -1)).T
+        trans = info['trans'].reshape((3, -1)).T
+        # vertices are relative to the root joint, fold it in the translation
+        j = smpl[gender].shape_terms(info['shape'])[1]
+        # workers fill the PC2 payload in place, the file is moved only once complete
+        tmp_path = pc2_path[:-4] + '_tmp.pc2'
+        V = mapPC2(tmp_path, poses.shape[0], smpl[gender].v_template.shape[0])
+        forward_parallel(smpl[gender], V, poses, trans - j[0], info['shape'], threads)
+        nPoints = V.shape[1]
+        del V
         print("Writing PC2 file...")
-        writePC2(pc2_path, V)
+        os.replace(tmp_path, pc2_path)
     else:
-        V = readPC2(pc2_path)['V']
+        nPoints = readPC2Header(pc2_path)['nPoints']
 
-    if V.shape[1] != len(ob.data.vertices):
+    if nPoints != len(ob.data.vertices):
         sys.stderr.write("ERROR IN THE VERTEX COUNT FOR THE BODY!!!!!")
         sys.stderr.flush()
 